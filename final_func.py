@@ -1,4 +1,12 @@
+import copy
+import functools
+import hashlib
+import inspect
+import os
+import pickle
 import re
+import tempfile
+from collections import OrderedDict
 from typing import List
 
 import pandas as pd
@@ -12,6 +20,90 @@ from scipy.stats import mannwhitneyu
 from sklearn.utils import resample
 
 
+# filter masks: status_mask, position_mask, lap_time_mask, select
+_status_select = [1, 11, 12, 13, 14, 15, 16, 17, 18, 19]  # finished, or +? laps away from the finished
+_lap_time_limit = 360000  # milliseconds, 6 minutes
+
+
+def status_mask(df: pd.DataFrame, status_select: List[int] = None) -> pd.Series:
+    """
+    build a boolean mask of the records with normal status, without touching the dataframe
+    :param df: the dataframe containing the 'statusId' column
+    :param status_select: the status ids to keep, defaults to finished or +? laps away from the finished
+    :return: boolean series aligned with df's index
+
+    >>> test_df = pd.DataFrame({"statusId": [1, 2, 11, 19, 20]})
+    >>> status_mask(test_df).tolist()
+    [True, False, True, True, False]
+    >>> status_mask(test_df, status_select=[2]).tolist()
+    [False, True, False, False, False]
+    """
+    if status_select is None:
+        status_select = _status_select
+    return df['statusId'].isin(status_select)
+
+
+def position_mask(df: pd.DataFrame, top_num=5, front=True) -> pd.Series:
+    """
+    build a boolean mask dividing the position orders as fronts (<= top_num) and backs (> top_num)
+    :param df: the dataframe containing the 'positionOrder' column
+    :param top_num: the number (top 5) dividing the position orders as fronts and backs
+    :param front: if true, mask the front positions, otherwise mask the back positions
+    :return: boolean series aligned with df's index
+
+    >>> test_df = pd.DataFrame({"positionOrder": [1, 5, 6, 10]})
+    >>> position_mask(test_df).tolist()
+    [True, True, False, False]
+    >>> position_mask(test_df, top_num=6, front=False).tolist()
+    [False, False, False, True]
+    """
+    if front:
+        return df['positionOrder'] <= top_num
+    return df['positionOrder'] > top_num
+
+
+def lap_time_mask(df: pd.DataFrame, max_ms=_lap_time_limit) -> pd.Series:
+    """
+    build a boolean mask of the laps finished within max_ms milliseconds
+    :param df: the dataframe containing the 'milliseconds' column
+    :param max_ms: the lap time cut-off in milliseconds
+    :return: boolean series aligned with df's index
+
+    >>> test_df = pd.DataFrame({"milliseconds": ['98109', '360000', '360001']})
+    >>> lap_time_mask(test_df).tolist()
+    [True, True, False]
+    """
+    return df['milliseconds'].astype(int) <= max_ms
+
+
+def select(df: pd.DataFrame, mask: pd.Series = None, columns: List[str] = None) -> pd.DataFrame:
+    """
+    index df once with a combined mask: masks can be combined with & and | beforehand, so that only the final
+    rows and columns are built into a new dataframe, instead of one intermediate frame per filter
+    :param df: the base dataframe, never modified
+    :param mask: boolean series aligned with df's index, None for all rows
+    :param columns: the columns to keep, None for all columns
+    :return: the selected dataframe (df itself if neither mask nor columns is given)
+
+    >>> test_df = pd.DataFrame({"positionOrder": [1, 7, 3], "statusId": [1, 1, 2], "stop": [1, 2, 1]})
+    >>> select(test_df, status_mask(test_df) & position_mask(test_df), ['stop'])
+       stop
+    0     1
+    >>> select(test_df, columns=['stop'])
+       stop
+    0     1
+    1     2
+    2     1
+    """
+    if mask is None and columns is None:
+        return df
+    if mask is None:
+        return df[columns]
+    if columns is None:
+        return df.loc[mask]
+    return df.loc[mask, columns]
+
+
 # general purpose: merge_data, process_data, pit_stop_group
 def merge_data(_df_list: List[pd.DataFrame]) -> pd.DataFrame:
     """
@@ -92,7 +184,7 @@ def merge_data(_df_list: List[pd.DataFrame]) -> pd.DataFrame:
 
 def process_data(mg_df: pd.DataFrame, normal_status=True, totals=True, deviation=True) -> pd.DataFrame:
     """
-    process the data for analysis:
+    process the data for analysis (the input dataframe is left unchanged):
     1. filter normal status
     2. add total laps for each record
     3. add total pit stops for each record
@@ -124,26 +216,26 @@ def process_data(mg_df: pd.DataFrame, normal_status=True, totals=True, deviation
     7       2         5              5  ...      0.30       0.366667               0.275
     <BLANKLINE>
     [8 rows x 12 columns]
+    >>> len(test_df)
+    9
     """
     # 1. filtering normal status
     if normal_status:
-        _status_select = [1, 11, 12, 13, 14, 15, 16, 17, 18, 19]
-        mg_df.drop(mg_df[~mg_df['statusId'].isin(_status_select)].index, inplace=True)
+        mg_df = select(mg_df, status_mask(mg_df))
     # 2&3. add total laps & total pit stops for each record
     if totals:
-        _total_laps = mg_df[(mg_df['positionOrder'] == 1) & (mg_df['stop'] == 1)].reset_index(drop=True)[
-            ['raceId', 'laps']]
+        _total_laps = select(mg_df, (mg_df['positionOrder'] == 1) & (mg_df['stop'] == 1),
+                             ['raceId', 'laps']).reset_index(drop=True)
         _total_laps.columns = [str(_total_laps.columns[0]), 'total_laps']
         _total_stops = mg_df.groupby(by=['raceId', 'driverId'], as_index=False)['stop'].max()
         _total_stops.columns = list(_total_stops.columns[:2]) + ['total_stops']
         mg_df = pd.merge(mg_df, _total_laps, on='raceId')
         mg_df = pd.merge(mg_df, _total_stops, on=['raceId', 'driverId'])
         # 4. calculate the proportion of lap when the driver pit for each pit record
-        mg_df['lap_prop'] = mg_df.apply(lambda x: x['lap'] / x['total_laps'], axis=1)
+        mg_df['lap_prop'] = mg_df['lap'] / mg_df['total_laps']
         if deviation:
             # 5. calculate how far the lap proportion deviates from the ideal even distribution for each pit record
-            mg_df['abs_deviation'] = mg_df.apply(lambda x: abs(x['stop'] / (x['total_stops'] + 1) - x['lap_prop']),
-                                                 axis=1)
+            mg_df['abs_deviation'] = (mg_df['stop'] / (mg_df['total_stops'] + 1) - mg_df['lap_prop']).abs()
             # 6. deviation mean, grouped by each driver in each race
             avg_deviation = pd.DataFrame(mg_df.groupby(['raceId', 'driverId'])['abs_deviation'].mean())
             avg_deviation = avg_deviation.add_suffix('_mean').reset_index()
@@ -188,10 +280,10 @@ def pit_stop_group(df: pd.DataFrame, by='pit_order'):
         max_num = df['total_stops'].max()
         _df_dict = {}
         for i in range(1, max_num + 1):
-            _df_dict[i] = df[df['total_stops'] == i][['stop', 'positionOrder', 'lap_prop']]
+            _df_dict[i] = select(df, df['total_stops'] == i, ['stop', 'positionOrder', 'lap_prop'])
         return _df_dict
     elif by == 'total_stops':
-        pitstop_df = df[["raceId", "driverId", 'positionOrder', "total_stops"]]
+        pitstop_df = select(df, columns=["raceId", "driverId", 'positionOrder', "total_stops"])
         _df_group = pitstop_df.groupby(["raceId", "driverId", 'positionOrder'], as_index=False)["total_stops"].count()
         _df_group["positionOrder"] = _df_group["positionOrder"].astype(int)
         _df_group.sort_values(by=["raceId", 'driverId'], inplace=True)
@@ -212,18 +304,587 @@ def lap_data_process(df: pd.DataFrame, lap_df: pd.DataFrame) -> pd.DataFrame:
     1       1         2              2     49.467017
 
     """
-    position_df = df[["raceId", "driverId", "positionOrder"]]
-    joined_table = lap_df.merge(position_df, on=["raceId", "driverId"], how="left")
-    joined_table["milliseconds"] = joined_table["milliseconds"].astype(int)
+    position_df = select(df, columns=["raceId", "driverId", "positionOrder"])
     # since most of the time spend for each lap is below 5 minutes, we assumed that the time spent greater than 5 minutes should be caused by accidents rather than strategy.
     # Thus, we focus on lap with time spend less than 6 minutes.
-    joined_table= joined_table.loc[joined_table['milliseconds'] <= 360000]
-    joined_table['lap_second']= joined_table['milliseconds'] /1000
+    # the cut-off only depends on lap_df, so it is applied before the merge to keep the joined table small
+    # parse the lap times once; the mask then reads the already converted column
+    _laps = lap_df[["raceId", "driverId"]].assign(milliseconds=lap_df['milliseconds'].astype(int))
+    _lap_mask = lap_time_mask(_laps)
+    joined_table = select(_laps, _lap_mask, ["raceId", "driverId"])
+    joined_table = joined_table.assign(lap_second=_laps.loc[_lap_mask, 'milliseconds'] / 1000)
+    joined_table = joined_table.merge(position_df, on=["raceId", "driverId"], how="left")
     df_group = joined_table.groupby(["raceId", "driverId", 'positionOrder'], as_index=False)['lap_second'].std()
     df_group.sort_values(by=['raceId', 'positionOrder'], inplace=True)
     df_group.rename(columns={'lap_second': 'lap_time_STD'}, inplace=True)
     return df_group
 
+# standings: standings_index, standing_at, standings_range, points_gap_to_leader, standings_features
+_round_base = 100  # a season has fewer than 100 rounds, so year * 100 + round orders the races in time
+_standings_cols = ['points', 'position', 'wins']
+
+
+def standings_index(standings: pd.DataFrame, races: pd.DataFrame, by='driverId') -> dict:
+    """
+    index the driver (or constructor) standings as season-ordered arrays keyed by id
+    :param standings: driver_standings.csv or constructor_standings.csv
+    :param races: races.csv, used to order the standings by year and round
+    :param by: the id column, 'driverId' or 'constructorId'
+    :return: a dictionary with
+        'by': the id column,
+        'race_key': series of the season-ordered key (year * 100 + round) of each raceId,
+        'leader': series of the leader's points after each race, indexed by the sorted race keys,
+        'table': the standings sorted by id and race key,
+        'ids': dictionary of {id: {'race_key', 'raceId', 'points', 'position', 'wins': array}}, ordered by race key
+
+    >>> races = pd.DataFrame({"raceId": [1, 2, 3, 4], "year": [2020]*3+[2021], "round": [1, 2, 3, 1]})
+    >>> standings = pd.DataFrame({"raceId": [1, 1, 2, 2, 3, 3, 4, 4],\
+                   "driverId": [1, 2]*4,\
+                   "points": [25, 18, 43, 43, 61, 68, 18, 25],\
+                   "position": [1, 2, 1, 2, 2, 1, 2, 1],\
+                   "wins": [1, 0, 1, 1, 1, 2, 0, 1]})
+    >>> index = standings_index(standings, races)
+    >>> index['ids'][2]['race_key']
+    array([202001, 202002, 202003, 202101])
+    >>> index['ids'][2]['points']
+    array([18, 43, 68, 25])
+    >>> index['leader']
+    race_key
+    202001    25
+    202002    43
+    202003    68
+    202101    25
+    Name: points, dtype: int64
+    >>> empty_index = standings_index(standings[:0], races)
+    >>> empty_index['ids'], len(empty_index['leader'])
+    ({}, 0)
+    >>> standing_at(empty_index, 1, 2020, 1) is None, len(points_gap_to_leader(empty_index, 1, 2020))
+    (True, 0)
+    """
+    race_key = races['year'] * _round_base + races['round']
+    race_key = pd.Series(race_key.to_numpy(), index=races['raceId'].to_numpy(), name='race_key')
+
+    table = standings[['raceId', by] + _standings_cols]
+    table = table.assign(race_key=table['raceId'].map(race_key))
+    table = table.loc[table['race_key'].notna()].astype({'race_key': 'int64'})
+    table = table.sort_values(by=[by, 'race_key'], kind='stable').reset_index(drop=True)
+
+    # split the sorted columns at each change of id; the per-id arrays are views into the table's columns
+    ids = {}
+    if len(table):
+        _columns = {col: table[col].to_numpy() for col in ['race_key', 'raceId'] + _standings_cols}
+        _id_values = table[by].to_numpy()
+        _bounds = np.flatnonzero(np.diff(_id_values)) + 1
+        _starts = np.concatenate(([0], _bounds))
+        _ends = np.concatenate((_bounds, [len(table)]))
+        ids = {_id_values[start].item(): {col: arr[start:end] for col, arr in _columns.items()}
+               for start, end in zip(_starts, _ends)}
+
+    leader = table.groupby('race_key')['points'].max()
+    return {'by': by, 'race_key': race_key, 'leader': leader, 'table': table, 'ids': ids}
+
+
+def standing_at(index: dict, _id: int, year: int, round_num: int):
+    """
+    look up the standing of a driver (or constructor) after round round_num of a season, in O(log n);
+    if the driver did not take part in that round, the latest earlier standing of the same season is returned
+    :param index: the standings index, built by standings_index
+    :param _id: the driver (or constructor) id
+    :param year: the season
+    :param round_num: the round of the season
+    :return: dictionary of raceId, points, position and wins; None if there is no standing yet in that season
+
+    >>> races = pd.DataFrame({"raceId": [1, 2, 3, 4], "year": [2020]*3+[2021], "round": [1, 2, 3, 1]})
+    >>> standings = pd.DataFrame({"raceId": [1, 1, 3, 3, 4, 4],\
+                   "driverId": [1, 2]*3,\
+                   "points": [25, 18, 43, 68, 18, 25],\
+                   "position": [1, 2, 2, 1, 2, 1],\
+                   "wins": [1, 0, 1, 2, 0, 1]})
+    >>> index = standings_index(standings, races)
+    >>> standing_at(index, 2, 2020, 3)
+    {'raceId': 3, 'points': 68, 'position': 1, 'wins': 2}
+    >>> standing_at(index, 2, 2020, 2)
+    {'raceId': 1, 'points': 18, 'position': 2, 'wins': 0}
+    >>> standing_at(index, 2, 2019, 22) is None
+    True
+    """
+    arrays = index['ids'].get(_id)
+    if arrays is None:
+        return None
+    pos = np.searchsorted(arrays['race_key'], year * _round_base + round_num, side='right') - 1
+    if pos < 0 or arrays['race_key'][pos] // _round_base != year:
+        return None
+    return {col: arrays[col][pos].item() for col in ['raceId'] + _standings_cols}
+
+
+def standings_range(index: dict, _id: int, start: tuple, end: tuple) -> pd.DataFrame:
+    """
+    get the standings of a driver (or constructor) between two rounds, both included
+    :param index: the standings index, built by standings_index
+    :param _id: the driver (or constructor) id
+    :param start: (year, round) of the first round
+    :param end: (year, round) of the last round
+    :return: dataframe of year, round, raceId, points, position and wins, ordered by year and round
+
+    >>> races = pd.DataFrame({"raceId": [1, 2, 3, 4], "year": [2020]*3+[2021], "round": [1, 2, 3, 1]})
+    >>> standings = pd.DataFrame({"raceId": [1, 2, 3, 4],\
+                   "driverId": [1]*4,\
+                   "points": [25, 43, 61, 18],\
+                   "position": [1, 1, 2, 2],\
+                   "wins": [1, 1, 1, 0]})
+    >>> index = standings_index(standings, races)
+    >>> standings_range(index, 1, (2020, 2), (2021, 1))
+       year  round  raceId  points  position  wins
+    0  2020      2       2      43         1     1
+    1  2020      3       3      61         2     1
+    2  2021      1       4      18         2     0
+    """
+    arrays = index['ids'].get(_id, {col: np.array([], dtype='int64') for col in ['race_key', 'raceId'] + _standings_cols})
+    lo = np.searchsorted(arrays['race_key'], start[0] * _round_base + start[1], side='left')
+    hi = np.searchsorted(arrays['race_key'], end[0] * _round_base + end[1], side='right')
+    _keys = arrays['race_key'][lo:hi]
+    _df = pd.DataFrame({'year': _keys // _round_base, 'round': _keys % _round_base})
+    for col in ['raceId'] + _standings_cols:
+        _df[col] = arrays[col][lo:hi]
+    return _df
+
+
+def points_gap_to_leader(index: dict, _id: int, year: int, rounds=None) -> pd.Series:
+    """
+    calculate the points gap between the championship leader and a driver (or constructor) after each round
+    :param index: the standings index, built by standings_index
+    :param _id: the driver (or constructor) id
+    :param year: the season
+    :param rounds: the rounds to look up, defaults to every round of the season in the index
+    :return: series of the gaps, indexed by round; a driver without standing yet in the season counts as 0 points
+
+    >>> races = pd.DataFrame({"raceId": [1, 2, 3, 4], "year": [2020]*3+[2021], "round": [1, 2, 3, 1]})
+    >>> standings = pd.DataFrame({"raceId": [1, 1, 2, 3, 3, 4, 4],\
+                   "driverId": [1, 2, 1, 1, 2, 1, 2],\
+                   "points": [25, 18, 50, 61, 68, 18, 25],\
+                   "position": [1, 2, 1, 2, 1, 2, 1],\
+                   "wins": [1, 0, 2, 2, 1, 0, 1]})
+    >>> index = standings_index(standings, races)
+    >>> points_gap_to_leader(index, 2, 2020)
+    round
+    1     7
+    2    32
+    3     0
+    Name: gap, dtype: int64
+    >>> points_gap_to_leader(index, 1, 2021, rounds=[1])
+    round
+    1    7
+    Name: gap, dtype: int64
+    """
+    leader = index['leader']
+    season_start = year * _round_base
+    if rounds is None:
+        _keys = leader.index.to_numpy()
+        _keys = _keys[(_keys >= season_start) & (_keys < season_start + _round_base)]
+    else:
+        _keys = season_start + np.asarray(rounds, dtype='int64')
+    leader_points = leader.reindex(_keys).to_numpy()
+
+    arrays = index['ids'].get(_id)
+    points = np.zeros(len(_keys), dtype=leader_points.dtype)
+    if arrays is not None:
+        pos = np.searchsorted(arrays['race_key'], _keys, side='right') - 1
+        valid = (pos >= 0) & (arrays['race_key'][np.maximum(pos, 0)] >= season_start)
+        points[valid] = arrays['points'][pos[valid]]
+    return pd.Series(leader_points - points, index=pd.Index(_keys % _round_base, name='round'), name='gap')
+
+
+def standings_features(df: pd.DataFrame, index: dict, prefix: str = None) -> pd.DataFrame:
+    """
+    add the standings each driver (or constructor) had going into each race, i.e. after the previous round of
+    the same season, so that they can be used as features alongside process_data output
+    :param df: the dataframe containing raceId and the index's id column, left unchanged
+    :param index: the standings index, built by standings_index
+    :param prefix: prefix of the new columns, defaults to 'driver_' or 'constructor_'
+    :return: a new dataframe with <prefix>points, <prefix>position and <prefix>wins; NaN for the first race of a season
+
+    >>> races = pd.DataFrame({"raceId": [1, 2, 3, 4], "year": [2020]*3+[2021], "round": [1, 2, 3, 1]})
+    >>> standings = pd.DataFrame({"raceId": [1, 1, 2, 2, 3, 3, 4, 4],\
+                   "driverId": [1, 2]*4,\
+                   "points": [25, 18, 43, 43, 61, 68, 18, 25],\
+                   "position": [1, 2, 1, 2, 2, 1, 2, 1],\
+                   "wins": [1, 0, 1, 1, 1, 2, 0, 1]})
+    >>> index = standings_index(standings, races)
+    >>> test_df = pd.DataFrame({"raceId": [3, 3, 4, 2], "driverId": [1, 2, 1, 2], "stop": [1, 1, 2, 1]})
+    >>> standings_features(test_df, index)
+       raceId  driverId  stop  driver_points  driver_position  driver_wins
+    0       3         1     1           43.0              1.0          1.0
+    1       3         2     1           43.0              2.0          1.0
+    2       4         1     2            NaN              NaN          NaN
+    3       2         2     1           18.0              2.0          0.0
+    """
+    by = index['by']
+    if prefix is None:
+        prefix = by[:-len('Id')] + '_'
+
+    _query = pd.DataFrame({by: df[by].to_numpy(), 'race_key': df['raceId'].map(index['race_key']).to_numpy(),
+                           '_row': np.arange(len(df))})
+    _query = _query.loc[_query['race_key'].notna()].astype({'race_key': 'int64'}).sort_values(by='race_key')
+    _table = index['table'][[by, 'race_key'] + _standings_cols].rename(columns={'race_key': 'prev_key'})
+    _table = _table.sort_values(by='prev_key', kind='stable')
+
+    # the latest standing strictly before each race, dropped when it belongs to an earlier season
+    _found = pd.merge_asof(_query, _table, left_on='race_key', right_on='prev_key', by=by,
+                           allow_exact_matches=False)
+    _found = _found.loc[(_found['prev_key'] // _round_base) == (_found['race_key'] // _round_base)]
+
+    features = {}
+    for col in _standings_cols:
+        values = np.full(len(df), np.nan)
+        values[_found['_row'].to_numpy()] = _found[col].to_numpy()
+        features[prefix + col] = values
+    return df.assign(**features)
+
+
+# statistics cache: set_stats_cache, clear_stats_cache, stats_cache_info
+_stats_cache = OrderedDict()  # in-memory LRU cache, fingerprint -> result
+_stats_cache_size = 128
+_stats_cache_dir = None  # optional on-disk store, one pickle file per fingerprint
+_stats_cache_count = {'hits': 0, 'misses': 0}
+
+
+def set_stats_cache(maxsize=128, cache_dir: str = None):
+    """
+    configure the cache of the hypothesis statistics
+    :param maxsize: the maximum number of results kept in memory, the least recently used are dropped first
+    :param cache_dir: if given, results are also stored in (and loaded from) this folder
+    :return: None
+
+    a result is keyed on its samples and parameters, and on the source code of the statistics function and of
+    the helpers it declares in @_memoize_stats(...); editing any of them (comments included) makes its stored
+    results miss, so they are recomputed rather than served stale
+
+    >>> set_stats_cache(maxsize=2)
+    >>> stats_cache_info()['maxsize']
+    2
+    >>> set_stats_cache()
+    """
+    global _stats_cache_size, _stats_cache_dir
+    _stats_cache_size = maxsize
+    _stats_cache_dir = cache_dir
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    while len(_stats_cache) > _stats_cache_size:
+        _stats_cache.popitem(last=False)
+
+
+def clear_stats_cache(disk=False):
+    """
+    empty the in-memory cache of the hypothesis statistics and reset its counters
+    :param disk: if true, also delete the results stored in the cache folder
+    :return: None
+    """
+    _stats_cache.clear()
+    _stats_cache_count.update(hits=0, misses=0)
+    if disk and _stats_cache_dir is not None:
+        for file_name in os.listdir(_stats_cache_dir):
+            if file_name.endswith('.pkl'):
+                os.remove(os.path.join(_stats_cache_dir, file_name))
+
+
+def stats_cache_info() -> dict:
+    """
+    :return: the hits, misses, maximum size and current size of the in-memory statistics cache
+    """
+    return {'hits': _stats_cache_count['hits'], 'misses': _stats_cache_count['misses'],
+            'maxsize': _stats_cache_size, 'currsize': len(_stats_cache)}
+
+
+def _fingerprint(obj, _hash):
+    """
+    feed the content of obj into _hash: dataframes and series by their column names, dtypes and values
+    (not their index), containers item by item, anything else by its repr
+    """
+    if isinstance(obj, pd.DataFrame):
+        _hash.update(repr(('DataFrame', list(obj.columns), [str(t) for t in obj.dtypes])).encode())
+        _hash.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        _hash.update(repr(('Series', obj.name, str(obj.dtype))).encode())
+        _hash.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, dict):
+        _hash.update(b'{')
+        for key, value in obj.items():
+            _fingerprint(key, _hash)
+            _fingerprint(value, _hash)
+        _hash.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        _hash.update(b'[')
+        for item in obj:
+            _fingerprint(item, _hash)
+        _hash.update(b']')
+    else:
+        _hash.update(repr(obj).encode())
+    _hash.update(b'|')
+
+
+def _load_stats(file_path: str):
+    """
+    :return: the result stored in file_path; None if there is no such file or it cannot be read (recomputed then)
+    """
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            return pickle.load(f)
+    except (EOFError, pickle.UnpicklingError, OSError):
+        return None
+
+
+def _dump_stats(result, file_path: str):
+    """
+    store result in file_path through a temporary file in the same folder,
+    so that an interrupted dump never leaves a partial file behind
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _code_version(func) -> str:
+    """
+    :return: the source code of func, or its bytecode when the source is not available
+    """
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return repr(func.__code__.co_code)
+
+
+def _memoize_stats(*helpers):
+    """
+    memoize a statistics function on a fingerprint of its samples and parameters (defaults included),
+    in the in-memory LRU cache and, if configured, the on-disk store;
+    the fingerprint also covers the source of the function and of the helpers it calls, passed as *helpers
+    """
+    def decorator(func):
+        return _memoized(func, [_code_version(f) for f in (func,) + helpers])
+    return decorator
+
+
+def _memoized(func, _versions: List[str]):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        _hash = hashlib.sha256(func.__name__.encode())
+        _fingerprint(_versions, _hash)
+        _fingerprint(dict(bound.arguments), _hash)
+        key = _hash.hexdigest()
+
+        if key in _stats_cache:
+            _stats_cache.move_to_end(key)
+            _stats_cache_count['hits'] += 1
+            return copy.deepcopy(_stats_cache[key])
+        file_path = None if _stats_cache_dir is None else os.path.join(_stats_cache_dir, f'{key}.pkl')
+        result = _load_stats(file_path)
+        if result is not None:
+            _stats_cache_count['hits'] += 1
+        else:
+            result = func(*args, **kwargs)
+            _stats_cache_count['misses'] += 1
+            if file_path is not None:
+                _dump_stats(result, file_path)
+
+        _stats_cache[key] = result
+        while len(_stats_cache) > _stats_cache_size:
+            _stats_cache.popitem(last=False)
+        return copy.deepcopy(result)
+    return wrapper
+
+
+# hypothesis statistics: variance_stats, distribution_stats, comparison_stats, avg_deviation_stats, rank_stats
+def variance_stats(df: pd.DataFrame) -> list:
+    """
+    Hypothesis 1 statistics
+    Mann-Whitney U tests of the rank distributions between drivers taking 1 & 2, 2 & 3 and 3 & 1 total pit stops;
+    only the total_stops and positionOrder samples are fingerprinted
+    :param df: the dataframe grouped by driver and race
+    :return: list of {'stops': (total pit stops a, total pit stops b), 'p_value': p value}
+
+    >>> df = pd.DataFrame({"raceId":[1,2,2,4,6,7,3,3],"driverId":[1,2,3,4,5,6,7,1],'positionOrder':[3,4,5,1,2,2,1,3], "total_stops":[3,2,3,1,2,3,1,2]})
+    >>> clear_stats_cache()
+    >>> variance_stats(df)[0]
+    {'stops': (1, 2), 'p_value': 0.1386406338132186}
+    >>> _ = variance_stats(df)
+    >>> _ = variance_stats(df.assign(raceId=0))  # same samples, unused column changed
+    >>> stats_cache_info()['hits'], stats_cache_info()['misses']
+    (2, 1)
+    """
+    return _variance_stats(df[['total_stops', 'positionOrder']])
+
+
+@_memoize_stats()
+def _variance_stats(df: pd.DataFrame) -> list:
+    results = []
+    for a, b in [(1, 2), (2, 3), (3, 1)]:
+        p_value = mannwhitneyu(df[df['total_stops'] == a]['positionOrder'],
+                               df[df['total_stops'] == b]['positionOrder']).pvalue
+        results.append({'stops': (a, b), 'p_value': float(p_value)})
+    return results
+
+
+@_memoize_stats()
+def distribution_stats(_df_dict: dict, max_num_of_stops=3) -> dict:
+    """
+    Hypothesis 2 statistics
+    describe the lap proportions of each pit stop and test them against the even dividing point
+    :param _df_dict: the dictionary of dataframe, grouped using pit_stop_group
+    :param max_num_of_stops: consider only total pit stops = 1, 2, ..., max_num_of_stops
+    :return: dictionary of {total pit stops: [one dictionary of mean, std, perc_1, perc_2, mu, t_p_value and
+    wilcoxon_p_value per pit stop]}
+
+    >>> df = pd.DataFrame({"stop": [1, 1, 2, 1, 2], "lap_prop": [0.25, 0.15, 0.30, 0.15, 0.30]})
+    >>> distribution_stats({1: df[:1], 2: df[1:]}, max_num_of_stops=2)[2][1]
+    {'mean': 0.3, 'std': 0.0, 'perc_1': 100.0, 'perc_2': 100.0, 'mu': 0.6666666666666666, 't_p_value': 0.0, 'wilcoxon_p_value': 0.5}
+    """
+    results = {}
+    for ps_num in range(1, max_num_of_stops + 1):
+        _df_tmp = _df_dict[ps_num]  # get dataframe of total pit stop = ps_num
+        results[ps_num] = []
+        for i in range(1, ps_num + 1):
+            df = _df_tmp[_df_tmp['stop'] == i]['lap_prop']
+            df_mean = round(df.mean(), ndigits=3)
+            df_std = round(df.std(), ndigits=3)
+            even_divide = i / (ps_num + 1)  # even dividing point
+            perc_1 = len(df[(df <= df_mean + df_std) & (df >= df_mean - df_std)]) / len(df)
+            perc_2 = len(df[(df <= df_mean + 2 * df_std) & (df >= df_mean - 2 * df_std)]) / len(df)
+            results[ps_num].append({'mean': float(df_mean), 'std': float(df_std),
+                                    'perc_1': round(100 * perc_1, ndigits=1),
+                                    'perc_2': round(100 * perc_2, ndigits=1),
+                                    'mu': even_divide,
+                                    't_p_value': float(ttest_1samp(a=df, popmean=even_divide).pvalue),
+                                    'wilcoxon_p_value': float(wilcoxon(df - even_divide).pvalue)})
+    return results
+
+
+def _front_back_sample(list_1: [pd.DataFrame], list_2: [pd.DataFrame], i: int, select_col: str):
+    """
+    :return: the i-th front sample of select_col and the i-th back sample, resampled to the size of the front one
+    """
+    df_f = list_1[i][select_col]  # front
+    df_b = resample(list_2[i][select_col], replace=True, n_samples=len(df_f), random_state=123)  # back
+    return df_f, df_b
+
+
+@_memoize_stats(_front_back_sample)
+def comparison_stats(list_1: [pd.DataFrame], list_2: [pd.DataFrame], select_col='lap_prop', non_para=False) -> list:
+    """
+    Hypothesis 3 statistics
+    compare the front and the (resampled) back records of each pit stop, grouped by front_back_division
+    :param list_1: the list of dataframes with position order in the front
+    :param list_2: the list of dataframes with position order in the back
+    :param select_col: the numeric column to be studied
+    :param non_para: if true, use non-parametric test
+    :return: list of {'total': total pit stops, 'pit': pit stop number, 'front_mean', 'back_mean', 'p_value'}
+
+    >>> front = [pd.DataFrame({"stop": [1]*4, "lap_prop": [0.1, 0.2, 0.3, 0.4]})]*6
+    >>> back = [pd.DataFrame({"stop": [1]*4, "lap_prop": [0.5, 0.6, 0.7, 0.8]})]*6
+    >>> comparison_stats(front, back, non_para=True)[0]
+    {'total': 1, 'pit': 1, 'front_mean': 0.25, 'back_mean': 0.675, 'p_value': 0.026518721959430728}
+    """
+    plot_index = [[1, 1], [2, 1], [2, 2], [3, 1], [3, 2], [3, 3]]
+    results = []
+    for _i, (_total, _pit) in enumerate(plot_index):
+        df_f, df_b = _front_back_sample(list_1, list_2, _i, select_col)
+        if not non_para:
+            p_value = ttest_ind(df_f, df_b).pvalue
+        else:
+            p_value = mannwhitneyu(df_f, df_b).pvalue
+        results.append({'total': _total, 'pit': _pit,
+                        'front_mean': float(round(df_f.mean(), ndigits=3)),
+                        'back_mean': float(round(df_b.mean(), ndigits=3)),
+                        'p_value': float(p_value)})
+    return results
+
+
+@_memoize_stats(_front_back_sample)
+def avg_deviation_stats(list_1: [pd.DataFrame], list_2: [pd.DataFrame]) -> list:
+    """
+    Hypothesis 3 statistics
+    Mann-Whitney U tests of the average deviations between the front and the (resampled) back records
+    :param list_1: the list of dataframes with position order in the front
+    :param list_2: the list of dataframes with position order in the back
+    :return: list of {'total_stops', 'front_mean', 'back_mean', 'p_value'}, one per total pit stops
+
+    >>> front = [pd.DataFrame({"total_stops": [1]*4, "abs_deviation_mean": [0.1, 0.2, 0.3, 0.4]})]
+    >>> back = [pd.DataFrame({"total_stops": [1]*4, "abs_deviation_mean": [0.5, 0.6, 0.7, 0.8]})]
+    >>> avg_deviation_stats(front, back)
+    [{'total_stops': 1, 'front_mean': 0.25, 'back_mean': 0.675, 'p_value': 0.026518721959430728}]
+    """
+    results = []
+    for i in range(len(list_1)):
+        _df_front, _df_back = _front_back_sample(list_1, list_2, i, 'abs_deviation_mean')
+        results.append({'total_stops': i + 1,
+                        'front_mean': float(round(_df_front.mean(), ndigits=3)),
+                        'back_mean': float(round(_df_back.mean(), ndigits=3)),
+                        'p_value': float(mannwhitneyu(_df_front, _df_back).pvalue)})
+    return results
+
+
+def _rank_split(df: pd.DataFrame, top_num=5, compare_low=False):
+    """
+    :return: the lap time STD of the high ranking drivers and the low ranking sample, resampled to the same size;
+    unless compare_low, the low ranking sample is the one of the published analysis, which is a bootstrap of the
+    high ranking drivers themselves (kept as the default so that the published H4 result is reproduced)
+    """
+    df_high = df.loc[position_mask(df, top_num), 'lap_time_STD']
+    df_low = df.loc[position_mask(df, top_num, front=False), 'lap_time_STD'] if compare_low else df_high
+    df_low = resample(df_low, replace=True, n_samples=len(df_high), random_state=123)
+    return df_high, df_low
+
+
+def rank_stats(df: pd.DataFrame, top_num=5, threshold=0.05, compare_low=False) -> dict:
+    """
+    Hypothesis 4 statistics
+    Mann-Whitney U test of the lap time STD between high ranking drivers and the "low ranking" sample of the
+    published analysis, a bootstrap of the high ranking drivers (see _rank_split);
+    only the positionOrder and lap_time_STD samples are fingerprinted
+    :param df: the dataframe containing the standard deviation of time spent on laps for each driver in a race
+    :param top_num: the number (top 5) dividing the position orders as high ranking and low ranking
+    :param threshold: the threshold used to evalute whether H0 should be rejected
+    :param compare_low: if true, test against the (resampled) drivers ranked after top_num instead
+    :return: {'p_value': p value, 'reject': whether H0 is rejected}
+
+    >>> test_df = pd.DataFrame({"raceId": [1]*8,"driverId": [1,2,3,4,5,6,7,8],"positionOrder": [1,2,3,4,5,6,7,8],"lap_time_STD":[2,5,1,3,4,2,3,6]})
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as cache_dir:
+    ...     set_stats_cache(cache_dir=cache_dir)
+    ...     clear_stats_cache()
+    ...     first = rank_stats(test_df)
+    ...     clear_stats_cache()
+    ...     second = rank_stats(test_df)
+    ...     info = stats_cache_info()
+    ...     set_stats_cache()
+    >>> first == second, info['hits'], info['misses']
+    (True, 1, 0)
+    >>> first
+    {'p_value': 0.9149990485758882, 'reject': False}
+    >>> rank_stats(test_df, compare_low=True)
+    {'p_value': 0.20167695355004422, 'reject': False}
+    """
+    return _rank_stats(df[['positionOrder', 'lap_time_STD']], top_num=top_num, threshold=threshold,
+                       compare_low=compare_low)
+
+
+@_memoize_stats(_rank_split)
+def _rank_stats(df: pd.DataFrame, top_num=5, threshold=0.05, compare_low=False) -> dict:
+    df_high, df_low = _rank_split(df, top_num, compare_low)
+    p_value = float(mannwhitneyu(df_high, df_low).pvalue)
+    return {'p_value': p_value, 'reject': p_value < threshold}
+
+
 # hypothesis 1: pitstop_boxplot, stop_chart, analysis_of_variance
 def pitstop_boxplot(df: pd.DataFrame):
     """
@@ -288,27 +949,14 @@ def analysis_of_variance(df: pd.DataFrame):
     """
     print('H0: There is no significant difference in rank distribution between drivers taking a different number of '
           'total pit stops.')
-    for i in range(1, 4):
-        if i <= 2:
-            filtered_df1 = df[df['total_stops'] == i]
-            filtered_df2 = df[df['total_stops'] == i + 1]
-            p_value = mannwhitneyu(filtered_df1['positionOrder'], filtered_df2['positionOrder']).pvalue
-            print('-' * 88)
-            print('P-value between {} pitstop and {} pitstop is {}'.format(i, i + 1, p_value))
-            if p_value > 0.05:
-                print("H0 cannot be rejected")
-            else:
-                print("Reject H0.", "There is a difference.")
-        if i == 3:
-            filtered_df1 = df[df['total_stops'] == i]
-            filtered_df2 = df[df['total_stops'] == i - 2]
-            p_value = mannwhitneyu(filtered_df1['positionOrder'], filtered_df2['positionOrder']).pvalue
-            print('-' * 88)
-            print('P-value between {} pitstop and {} pitstop is {}'.format(i, i - 2, p_value))
-            if p_value > 0.05:
-                print("H0 cannot be rejected")
-            else:
-                print("Reject H0.", "There is a difference.")
+    for result in variance_stats(df):
+        p_value = result['p_value']
+        print('-' * 88)
+        print('P-value between {} pitstop and {} pitstop is {}'.format(*result['stops'], p_value))
+        if p_value > 0.05:
+            print("H0 cannot be rejected")
+        else:
+            print("Reject H0.", "There is a difference.")
 
 
 # hypothesis 2: distribution_plot
@@ -369,6 +1017,11 @@ def distribution_plot(_df_dict: dict, show_mean: bool = True, show_description:
         0.0% within mean ± 2 std
          One sample T Test, mu=0.75, p value=nan
          One sample Wilcoxon Signed Rank Test, mu=0.75, p value=1.0
+    >>> one_row = pd.DataFrame({"stop": [1, 2, 3], "positionOrder": [1]*3, "lap_prop": [0.2, 0.5, 0.7]})
+    >>> distribution_plot({1: one_row[:1], 2: one_row[:2], 3: one_row}, show_description=False)
+    Total Pit Stops:  1
+    Total Pit Stops:  2
+    Total Pit Stops:  3
     """
     # plot settings
     bins = np.linspace(0, 1, 50)
@@ -376,6 +1029,8 @@ def distribution_plot(_df_dict: dict, show_mean: bool = True, show_description:
     color_bin2 = ['deepskyblue', 'orangered', 'crimson']
 
     max_num_of_stops = 3  # consider only total pit stops = 1,2,3
+    # the tests only run (or are read from the cache) when they are shown
+    _stats = distribution_stats(_df_dict, max_num_of_stops) if show_description else None
     for ps_num in range(1, max_num_of_stops + 1):
         _df_tmp = _df_dict[ps_num]  # get dataframe of total pit stop = ps_num
         # _df_list: [<df: no.1 pit stop out of ps_num>, <df: no.2 pit stop out of ps_num>, ...]
@@ -395,27 +1050,22 @@ def distribution_plot(_df_dict: dict, show_mean: bool = True, show_description:
             # mean, std calculation
             df_mean = round(df.mean(), ndigits=3)
             df_std = round(df.std(), ndigits=3)
-            # show mean line (x = mean)
             # even dividing point:
             even_divide = (plot_count + 1) / (ps_num + 1)
+            # show mean line (x = mean)
             if show_mean:
                 plt.axvline(x=df_mean, color=color_bin2[plot_count], linewidth=4)
                 plt.axvline(x=even_divide, color='gold', linewidth=4)
             plot_count += 1
             # show distribution description
             if show_description:
+                _result = _stats[ps_num][plot_count - 1]
                 print('No. ', plot_count, ' pit stop: ', 'mean = ', df_mean, ' std = ', df_std)
-                perc_1 = len(df[(df <= df_mean + df_std) & (df >= df_mean - df_std)]) / len(df)
-                perc_2 = len(df[(df <= df_mean + 2 * df_std) & (df >= df_mean - 2 * df_std)]) / len(df)
-                perc_1 = round(100 * perc_1, ndigits=1)
-                perc_2 = round(100 * perc_2, ndigits=1)
-                print(f'    {perc_1}% within mean ± 1 std')
-                print(f'    {perc_2}% within mean ± 2 std')
-                _test = ttest_1samp(a=df, popmean=even_divide)
-                print(f'     One sample T Test, mu={round(even_divide, ndigits=3)}, p value={_test.pvalue}')
-                _test = wilcoxon(df - even_divide)
+                print(f'    {_result["perc_1"]}% within mean ± 1 std')
+                print(f'    {_result["perc_2"]}% within mean ± 2 std')
+                print(f'     One sample T Test, mu={round(even_divide, ndigits=3)}, p value={_result["t_p_value"]}')
                 print(f'     One sample Wilcoxon Signed Rank Test, mu={round(even_divide, ndigits=3)}, '
-                      f'p value={_test.pvalue}')
+                      f'p value={_result["wilcoxon_p_value"]}')
         # save as picture
         plt.legend(loc="upper left")
         if save_fig: plt.savefig(f'image/hypo2/distribution_{ps_num}.png')
@@ -477,17 +1127,21 @@ def front_back_division(mg_df: pd.DataFrame, select_col='lap_prop', max_pit=3, t
     if select_col == 'abs_deviation_mean':
         df_select = mg_df[
             ['raceId', 'driverId', 'total_stops', 'positionOrder', 'abs_deviation_mean']].drop_duplicates()
-        df_tmp = df_select[df_select['positionOrder'] <= top_num][['total_stops', 'abs_deviation_mean']]
-        df_front = [df_tmp[df_tmp['total_stops'] == i] for i in range(1, max_pit + 1)]
-        df_tmp = df_select[df_select['positionOrder'] > top_num][['total_stops', 'abs_deviation_mean']]
-        df_back = [df_tmp[df_tmp['total_stops'] == i] for i in range(1, max_pit + 1)]
+        _front = position_mask(df_select, top_num)
+        _back = position_mask(df_select, top_num, front=False)
+        for i in range(1, max_pit + 1):
+            _total = df_select['total_stops'] == i
+            df_front.append(select(df_select, _front & _total, ['total_stops', 'abs_deviation_mean']))
+            df_back.append(select(df_select, _back & _total, ['total_stops', 'abs_deviation_mean']))
     else:
+        _front = position_mask(mg_df, top_num)
+        _back = position_mask(mg_df, top_num, front=False)
         for i in range(1, max_pit + 1):
-            df_tmp = mg_df[mg_df['total_stops'] == i]
+            _total = mg_df['total_stops'] == i
             for j in range(1, i + 1):
-                df_select = df_tmp[df_tmp['stop'] == j]
-                df_front.append(df_select[df_select['positionOrder'] <= top_num][['stop', select_col]])
-                df_back.append(df_select[df_select['positionOrder'] > top_num][['stop', select_col]])
+                _stop = _total & (mg_df['stop'] == j)
+                df_front.append(select(mg_df, _front & _stop, ['stop', select_col]))
+                df_back.append(select(mg_df, _back & _stop, ['stop', select_col]))
 
     return df_front, df_back
 
@@ -532,14 +1186,11 @@ def comparison_plot(list_1: [pd.DataFrame], list_2: [pd.DataFrame], select_col='
     color_bin2 = ['deepskyblue', 'crimson', 'lavender']
 
     plot_index = [[1, 1], [2, 1], [2, 2], [3, 1], [3, 2], [3, 3]]
-    plot_num = 6
-
-    for _i in range(plot_num):
-        _total = plot_index[_i][0]  # total pit stops
-        _pit = plot_index[_i][1]  # pit stop number
-        df_f = list_1[_i][select_col]  # front
-        df_b = resample(list_2[_i][select_col],
-                        replace=True, n_samples=len(df_f), random_state=123)  # back
+    # the tests only run (or are read from the cache) when they are shown
+    _stats = comparison_stats(list_1, list_2, select_col=select_col, non_para=non_para) if show_description else None
+
+    for _i, (_total, _pit) in enumerate(plot_index):  # total pit stops, pit stop number
+        df_f, df_b = _front_back_sample(list_1, list_2, _i, select_col)
         print('-' * 88)
         plt.figure(figsize=(12, 6))
         plt.title(f'Frequency Distribution of Lap Proportions: Total Pit Stops = {_total}, No.{_pit} pit stop')
@@ -556,11 +1207,7 @@ def comparison_plot(list_1: [pd.DataFrame], list_2: [pd.DataFrame], select_col='
             plt.axvline(x=df_b_mean, color=color_bin2[1], linewidth=4)
             if show_divide: plt.axvline(x=_pit / (_total + 1), color='gold', linewidth=4)
         if show_description:
-            if not non_para:
-                p_value = ttest_ind(df_f, df_b).pvalue
-            else:
-                p_value = mannwhitneyu(df_f, df_b).pvalue
-            print(f'Total Pits: {_total}, no.{_pit} pit, p value={p_value}')
+            print(f'Total Pits: {_total}, no.{_pit} pit, p value={_stats[_i]["p_value"]}')
 
         if save_fig: plt.savefig(f'image/hypo3/distribution_{_total}_{_pit}.png', transparent=False)
         plt.show()
@@ -590,12 +1237,9 @@ def avg_deviation_plot(list_1: [pd.DataFrame], list_2: [pd.DataFrame], save_fig=
     color_bin = ['tab:blue', 'tab:orange', 'tab:red']
     color_bin2 = ['deepskyblue', 'crimson', 'lavender']
 
-    num = len(list_1)
-    for i in range(num):
-        _df_front = list_1[i]['abs_deviation_mean']
-        _df_back = list_2[i]['abs_deviation_mean']
-
-        _df_back = resample(_df_back, replace=True, n_samples=len(_df_front), random_state=123)
+    _stats = avg_deviation_stats(list_1, list_2)
+    for i, _result in enumerate(_stats):
+        _df_front, _df_back = _front_back_sample(list_1, list_2, i, 'abs_deviation_mean')
         print('-' * 88)
         plt.figure(figsize=(12, 6))
         plt.title(f'Average Deviation Distribution, Total Pit Stops = {i + 1}')
@@ -605,14 +1249,14 @@ def avg_deviation_plot(list_1: [pd.DataFrame], list_2: [pd.DataFrame], save_fig=
         plt.hist(_df_front, bins, alpha=0.9, color=color_bin[0], label='Higher Ranking')
         plt.legend(loc="upper left")
 
-        _df_front_mean = round(_df_front.mean(), ndigits=3)
-        _df_back_mean = round(_df_back.mean(), ndigits=3)
+        _df_front_mean = _result['front_mean']
+        _df_back_mean = _result['back_mean']
 
         plt.axvline(x=_df_front_mean, color=color_bin2[0], linewidth=4)
         plt.axvline(x=_df_back_mean, color=color_bin2[1], linewidth=4)
 
         sig_level = 0.05
-        p_value = mannwhitneyu(_df_front, _df_back).pvalue
+        p_value = _result['p_value']
         print(f'Total Pit Stops = {i + 1}')
         print(f'Mann-Whitney U rank test p value={p_value}')
 
@@ -629,7 +1273,7 @@ def avg_deviation_plot(list_1: [pd.DataFrame], list_2: [pd.DataFrame], save_fig=
 
 
 # hypothesis 4
-def rank_df_plt(df: pd.DataFrame, top_num = 5, threshold=0.05):
+def rank_df_plt(df: pd.DataFrame, top_num = 5, threshold=0.05, compare_low=False):
     """
     this function is used to separate the positionOrder to high ranking or low ranking,
     create histogram showing the correlation between the ranking of drivers against the lap time std,
@@ -637,6 +1281,8 @@ def rank_df_plt(df: pd.DataFrame, top_num = 5, threshold=0.05):
     :param df: the dataframe containing the standard deviation of time spent on laps for each driver in a race
     :param top_num: the number (top 5) dividing the position orders as high ranking and low ranking
     :param threshold: the threshold used to evalute whether H0 should be rejected
+    :param compare_low: if true, compare with the drivers ranked after top_num; by default the low ranking sample
+    is a bootstrap of the high ranking drivers, as in the published analysis
     :return: histogram showing the correlation between the ranking of drivers against the lap time std and whether there is difference in the distribution of lap times STD between the ranking of drivers.
     >>> test_df = pd.DataFrame({"raceId": [1]*8,"driverId": [1,2,3,4,5,6,7,8],"positionOrder": [1,2,3,4,5,6,7,8],"lap_time_STD":[2,5,1,3,4,2,3,6]})
     >>> rank_df_plt(test_df)
@@ -648,19 +1294,7 @@ def rank_df_plt(df: pd.DataFrame, top_num = 5, threshold=0.05):
     H0 cannot be rejected
     """
     print('H0: There is no significant difference in the distribution of lap times STD between the ranking of drivers.')
-    rank_list = []
-    df = df.assign(rank='')
-    position_list = df['positionOrder'].tolist()
-
-    for position in position_list:
-        if position <= top_num:
-            rank_list.append('High Rank')
-        else:
-            rank_list.append('Low Rank')
-
-    df['rank'] = rank_list
-    df_high = df.loc[df['rank'] == 'High Rank']['lap_time_STD']
-    df_low = resample(df.loc[df['rank'] == 'High Rank']['lap_time_STD'], replace=True, n_samples=len(df_high), random_state=123)
+    df_high, df_low = _rank_split(df, top_num, compare_low)
     bins = np.linspace(0, 40, 20)
     color_bin = ['tab:blue', 'tab:orange', 'tab:red']
     plt.hist(df_low, bins, alpha=0.8, color=color_bin[2], label='Low Ranking')
@@ -671,11 +1305,11 @@ def rank_df_plt(df: pd.DataFrame, top_num = 5, threshold=0.05):
     plt.legend(loc="upper right")
     print(' ' * 88)
     plt.show()
-    pvalue = mannwhitneyu(df_high,df_low).pvalue
+    _result = rank_stats(df, top_num=top_num, threshold=threshold, compare_low=compare_low)
     print('-' * 88)
-    print('P-value between high ranking drivers and low ranking drivers is {}.'.format(pvalue))
+    print('P-value between high ranking drivers and low ranking drivers is {}.'.format(_result['p_value']))
     print('-' * 88)
-    if pvalue < threshold:
+    if _result['reject']:
         print("Reject H0.", "There is a difference.")
     else:
         print("H0 cannot be rejected")